@@ -0,0 +1,151 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from valutatrade_hub.core import rates_store, usecases
+from valutatrade_hub.core.models import Portfolio, User
+
+
+def _reset_state():
+    if usecases._journal is not None:
+        usecases._journal.close()
+    usecases._journal = None
+    usecases._journal_count = 0
+    usecases._journal_seq = None
+    usecases._JSON_CACHE.clear()
+    usecases._USERS_INDEX = None
+    usecases.SESSION["current_user"] = None
+    usecases._get_rate_cached.cache_clear()
+    if rates_store._conn is not None:
+        rates_store._conn.close()
+    rates_store._conn = None
+    rates_store._synced_mtime = None
+
+
+class JournalTest(unittest.TestCase):
+    """Журнал сделок portfolios.log и его свёртка в portfolios.json."""
+
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+        os.mkdir(usecases.DATA_DIR)
+        _reset_state()
+
+    def tearDown(self):
+        _reset_state()
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+    def write_state(self, portfolios, journal_seq=0):
+        with open(usecases.PORTFOLIOS_FILE, "w", encoding="utf-8") as f:
+            json.dump({"journal_seq": journal_seq, "portfolios": portfolios}, f)
+
+    def write_log(self, text):
+        with open(usecases.PORTFOLIOS_LOG, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def read_log(self):
+        with open(usecases.PORTFOLIOS_LOG, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def balance(self, user_id, code):
+        return usecases.load_portfolio(user_id)["wallets"][code].balance
+
+    def test_replay_applies_journal_on_top_of_snapshot(self):
+        self.write_state({"1": {"wallets": {"USD": {"balance": 10.0}}}})
+        usecases._journal_write(1, [["USD", 5.0]])
+        usecases._journal_write(1, [["EUR", 2.0]])
+
+        self.assertEqual(self.balance(1, "USD"), 15.0)
+        self.assertEqual(self.balance(1, "EUR"), 2.0)
+
+    def test_snapshot_folds_journal_and_truncates_it(self):
+        self.write_state({"1": {"wallets": {}}})
+        usecases._journal_write(1, [["USD", 100.0]])
+        usecases.snapshot()
+
+        with open(usecases.PORTFOLIOS_FILE, encoding="utf-8") as f:
+            state = json.load(f)
+        self.assertEqual(state["journal_seq"], 1)
+        self.assertEqual(state["portfolios"]["1"]["wallets"]["USD"]["balance"], 100.0)
+        self.assertEqual(self.read_log(), [])
+        self.assertEqual(self.balance(1, "USD"), 100.0)
+
+    def test_crash_before_truncate_does_not_double_count(self):
+        # снимок уже содержит запись seq=1, а журнал очистить не успели
+        self.write_state({"1": {"wallets": {"USD": {"balance": 100.0}}}}, journal_seq=1)
+        self.write_log('{"seq": 1, "uid": 1, "deltas": [["USD", 100.0]]}\n')
+
+        self.assertEqual(self.balance(1, "USD"), 100.0)
+
+        usecases._journal_write(1, [["USD", 1.0]])
+        self.assertEqual(self.read_log()[-1]["seq"], 2)
+        self.assertEqual(self.balance(1, "USD"), 101.0)
+
+    def test_failed_snapshot_save_keeps_cache_consistent(self):
+        self.write_state({"1": {"wallets": {}}})
+        usecases._journal_write(1, [["USD", 100.0]])
+
+        with mock.patch.object(usecases, "save_json", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                usecases.snapshot()
+
+        self.assertEqual(self.balance(1, "USD"), 100.0)
+        usecases.snapshot()
+        self.assertEqual(self.balance(1, "USD"), 100.0)
+
+    def test_torn_tail_is_cut_before_appending(self):
+        self.write_state({"1": {"wallets": {}}})
+        self.write_log(
+            '{"seq": 1, "uid": 1, "deltas": [["USD", 1.0]]}\n'
+            '{"seq": 2, "uid": 1, "del'
+        )
+
+        usecases._journal_write(1, [["USD", 2.0]])
+        usecases._journal_write(1, [["USD", 4.0]])
+
+        self.assertEqual([rec["seq"] for rec in self.read_log()], [1, 2, 3])
+        self.assertEqual(self.balance(1, "USD"), 7.0)
+
+    def test_sell_is_written_as_one_record(self):
+        self.write_state({"1": {"wallets": {"BTC": {"balance": 1.0}}}})
+        with open(rates_store.RATES_FILE, "w", encoding="utf-8") as f:
+            json.dump({"BTC": {"USD": 100.0}}, f)
+        user = User(1, "alice", "00" * 32, "salt", datetime.now())
+        user.portfolio = Portfolio(1, usecases.load_portfolio(1)["wallets"])
+        usecases.SESSION["current_user"] = user
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            usecases.sell(["--currency", "BTC", "--amount", "0.5"])
+
+        log = self.read_log()
+        self.assertEqual(len(log), 1)
+        self.assertEqual(log[0]["deltas"], [["BTC", -0.5], ["USD", 50.0]])
+        self.assertEqual(self.balance(1, "BTC"), 0.5)
+        self.assertEqual(self.balance(1, "USD"), 50.0)
+
+    def test_legacy_portfolio_formats_are_migrated(self):
+        with open(usecases.PORTFOLIOS_FILE, "w", encoding="utf-8") as f:
+            json.dump([{"user_id": 1, "wallets": {"EUR": {"balance": 2.0}}}], f)
+        self.assertEqual(usecases._get_portfolios_state(), {
+            "journal_seq": 0,
+            "portfolios": {"1": {"wallets": {"EUR": {"balance": 2.0}}}},
+        })
+
+        usecases._JSON_CACHE.clear()
+        with open(usecases.PORTFOLIOS_FILE, "w", encoding="utf-8") as f:
+            json.dump({"1": {"wallets": {}}, "_journal_seq": 3}, f)
+        self.assertEqual(usecases._get_portfolios_state(), {
+            "journal_seq": 3,
+            "portfolios": {"1": {"wallets": {}}},
+        })
+
+
+if __name__ == "__main__":
+    unittest.main()
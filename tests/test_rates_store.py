@@ -0,0 +1,63 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from valutatrade_hub.core import rates_store, usecases
+
+
+def _reset_state():
+    usecases._get_rate_cached.cache_clear()
+    if rates_store._conn is not None:
+        rates_store._conn.close()
+    rates_store._conn = None
+    rates_store._synced_mtime = None
+
+
+class RatesStoreTest(unittest.TestCase):
+    """Курсы из rates.json, перенесённые в SQLite."""
+
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+        os.mkdir(rates_store.DATA_DIR)
+        with open(rates_store.RATES_FILE, "w", encoding="utf-8") as f:
+            json.dump({"BTC": {"USD": 100.0}, "EUR": {"USD": 1.5}}, f)
+        _reset_state()
+
+    def tearDown(self):
+        _reset_state()
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+    def test_get_rates_to(self):
+        self.assertEqual(rates_store.get_rates_to("USD"), {"BTC": 100.0, "EUR": 1.5})
+
+    def test_store_error_is_not_memoized(self):
+        with mock.patch.object(
+            rates_store, "_sync", side_effect=sqlite3.OperationalError("locked")
+        ):
+            self.assertIsNone(usecases.get_rate("BTC", "USD"))
+        self.assertEqual(usecases.get_rate("BTC", "USD"), 100.0)
+
+    def test_missing_rates_json_clears_store_once(self):
+        self.assertEqual(rates_store.get_rate("BTC", "USD"), 100.0)
+        os.remove(rates_store.RATES_FILE)
+
+        self.assertIsNone(rates_store.get_rate("BTC", "USD"))
+        conn = rates_store._connect()
+        changes = conn.total_changes
+        self.assertFalse(rates_store.has_currency("BTC"))
+        self.assertEqual(conn.total_changes, changes)
+
+    def test_missing_data_dir_means_no_rate(self):
+        os.remove(rates_store.RATES_FILE)
+        os.rmdir(rates_store.DATA_DIR)
+        self.assertIsNone(usecases.get_rate("BTC", "USD"))
+
+
+if __name__ == "__main__":
+    unittest.main()
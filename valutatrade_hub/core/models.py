@@ -1,24 +1,54 @@
 import hashlib
+import hmac
 import secrets
 import string
 from datetime import datetime
+from types import MappingProxyType
+
+_SALT_ALPHABET = string.ascii_letters + string.digits + "!@#$%^&*?"
+
+# Схемы хэширования пароля:
+# v1 — sha256(password + salt), исходная, остаётся для старых записей;
+# v2 — sha256(salt + password): состояние хэша после соли считается один раз
+#      на пользователя, и при проверке дохэшируется только пароль.
+HASH_SCHEME_V1 = 1
+HASH_SCHEME_V2 = 2
+
+# Курсы к USD для Portfolio.get_total_value и обратные к ним
+_FX = MappingProxyType({
+    "USD": 1.0,
+    "EUR": 1.1,
+    "BTC": 50000.0,
+})
+_FX_INV = MappingProxyType({code: 1.0 / rate for code, rate in _FX.items()})
 
 
 class User:
+    __slots__ = ("_user_id", "_username", "_hashed_password",
+                 "_hashed_password_bytes", "_salt", "_salt_bytes",
+                 "_hash_scheme", "_h_template", "_registration_date",
+                 "portfolio")
+
     def __init__(self, user_id: int, username: str, hashed_password: str,
-                 salt: str, registration_date: datetime):
+                 salt: str, registration_date: datetime,
+                 hash_scheme: int = HASH_SCHEME_V1):
         self._user_id = user_id
         self.username = username                  
-        self._hashed_password = hashed_password
-        self._salt = salt                         
+        self._set_password_hash(hashed_password, salt, hash_scheme)
         self._registration_date = registration_date
 
                            
     @staticmethod
     def generate_salt(length: int = 8) -> str:
         """Генерирует случайную соль."""
-        alphabet = string.ascii_letters + string.digits + "!@#$%^&*?"
-        return ''.join(secrets.choice(alphabet) for _ in range(length))
+        return ''.join([secrets.choice(_SALT_ALPHABET) for _ in range(length)])
+
+    @staticmethod
+    def hash_password(password: str, salt: str) -> str:
+        """Хэширует пароль по схеме v2: sha256(salt + password)."""
+        h = hashlib.sha256(salt.encode())
+        h.update(password.encode())
+        return h.hexdigest()
 
   
     @property
@@ -43,6 +73,10 @@ class User:
     def salt(self):
         return self._salt
 
+    @property
+    def hash_scheme(self):
+        return self._hash_scheme
+
     @property
     def registration_date(self):
         return self._registration_date
@@ -66,18 +100,34 @@ class User:
             raise ValueError("Пароль должен быть не короче 4 символов")
 
         new_salt = self.generate_salt()
-        new_hash = hashlib.sha256((new_password + new_salt).encode()).hexdigest()
+        new_hash = self.hash_password(new_password, new_salt)
+        self._set_password_hash(new_hash, new_salt, HASH_SCHEME_V2)
 
-        self._salt = new_salt
-        self._hashed_password = new_hash
+    def _set_password_hash(self, hashed_password: str, salt: str, hash_scheme: int):
+        self._hashed_password = hashed_password
+        self._hashed_password_bytes = bytes.fromhex(hashed_password)
+        self._salt = salt
+        self._salt_bytes = salt.encode()
+        self._hash_scheme = hash_scheme
+        if hash_scheme == HASH_SCHEME_V2:
+            self._h_template = hashlib.sha256(self._salt_bytes)
+        else:
+            self._h_template = None
 
     def verify_password(self, password: str) -> bool:
         """Проверяет правильность введённого пароля."""
-        hashed = hashlib.sha256((password + self._salt).encode()).hexdigest()
-        return hashed == self._hashed_password
+        if self._h_template is not None:
+            h = self._h_template.copy()
+            h.update(password.encode())
+        else:
+            h = hashlib.sha256(password.encode())
+            h.update(self._salt_bytes)
+        return hmac.compare_digest(h.digest(), self._hashed_password_bytes)
 
 
 class Wallet:
+    __slots__ = ("currency_code", "_balance")
+
     def __init__(self, currency_code: str, balance: float = 0.0):
         self.currency_code = currency_code
         self.balance = balance
@@ -115,6 +165,15 @@ class Wallet:
         self._balance -= float(amount)
 
 
+    # Без проверок: вызывающий код уже проверил amount (float > 0, хватает средств)
+    def _add(self, amount: float):
+        self._balance += amount
+
+
+    def _sub(self, amount: float):
+        self._balance -= amount
+
+
     def get_balance_info(self) -> dict:
         return {
             "currency_code": self.currency_code,
@@ -123,6 +182,8 @@ class Wallet:
 
 
 class Portfolio:
+    __slots__ = ("_user_id", "_wallets")
+
     def __init__(self, user_id: int, wallets: dict[str, Wallet] | None = None):
         self._user_id = user_id
         self._wallets = wallets or {}
@@ -135,7 +196,7 @@ class Portfolio:
 
     @property
     def wallets(self):
-        return dict(self._wallets)
+        return MappingProxyType(self._wallets)
 
 
     def get_wallet(self, currency_code: str) -> Wallet | None:
@@ -148,17 +209,21 @@ class Portfolio:
         self._wallets[currency_code] = Wallet(currency_code)
 
 
+    def get_or_create_wallet(self, currency_code: str) -> Wallet:
+        wallet = self._wallets.get(currency_code)
+        if wallet is None:
+            wallet = self._wallets[currency_code] = Wallet(currency_code)
+        return wallet
+
+
     def get_total_value(self, base_currency: str = "USD") -> float:
-        exchange_rates = {
-            "USD": 1.0,
-            "EUR": 1.1,
-            "BTC": 50000.0,
-        }
-        if base_currency not in exchange_rates:
+        inv = _FX_INV.get(base_currency)
+        if inv is None:
             raise ValueError("Нет курса для базовой валюты")
         total = 0.0
         for code, wallet in self._wallets.items():
-            if code not in exchange_rates:
+            rate = _FX.get(code)
+            if rate is None:
                 continue
-            total += wallet.balance * exchange_rates[code]
-        return total / exchange_rates[base_currency]
\ No newline at end of file
+            total += wallet._balance * rate
+        return total * inv
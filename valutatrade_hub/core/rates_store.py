@@ -0,0 +1,106 @@
+import json
+import os
+import sqlite3
+
+DATA_DIR = "data"
+RATES_FILE = f"{DATA_DIR}/rates.json"
+RATES_DB = f"{DATA_DIR}/rates.db"
+
+_conn = None
+# st_mtime_ns rates.json, уже перенесённого в базу этим процессом;
+# _MISSING — файла нет и база уже очищена
+_MISSING = -1
+_synced_mtime = None
+
+
+def _connect():
+    """Открывает (один раз) базу курсов и создаёт таблицы."""
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(RATES_DB)
+        _conn.executescript("""
+            CREATE TABLE IF NOT EXISTS rates (
+                frm TEXT NOT NULL,
+                to_ TEXT NOT NULL,
+                rate REAL NOT NULL,
+                PRIMARY KEY (frm, to_)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER
+            ) WITHOUT ROWID;
+        """)
+    return _conn
+
+
+def _sync():
+    """
+    Переносит rates.json в базу, если файл изменился с последнего импорта.
+    mtime импортированного файла хранится в базе, поэтому новый процесс
+    не перечитывает JSON, пока его не отредактируют.
+    Если rates.json нет, база очищается: источником курсов остаётся JSON.
+    """
+    global _synced_mtime
+    conn = _connect()
+    try:
+        mtime = os.stat(RATES_FILE).st_mtime_ns
+    except FileNotFoundError:
+        if _synced_mtime != _MISSING:
+            # чистим один раз при переходе в состояние «файла нет»
+            row = conn.execute(
+                "SELECT 1 FROM meta WHERE key = 'source_mtime'"
+            ).fetchone()
+            if row is not None:
+                with conn:
+                    conn.execute("DELETE FROM rates")
+                    conn.execute("DELETE FROM meta WHERE key = 'source_mtime'")
+            _synced_mtime = _MISSING
+        return conn
+    if mtime == _synced_mtime:
+        return conn
+
+    row = conn.execute("SELECT value FROM meta WHERE key = 'source_mtime'").fetchone()
+    if row is None or row[0] != mtime:
+        with open(RATES_FILE, "r", encoding="utf-8") as f:
+            rates = json.load(f)
+        with conn:
+            conn.execute("DELETE FROM rates")
+            conn.executemany(
+                "INSERT INTO rates (frm, to_, rate) VALUES (?, ?, ?)",
+                (
+                    (a, b, r)
+                    for a, targets in rates.items()
+                    for b, r in targets.items()
+                ),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('source_mtime', ?)",
+                (mtime,),
+            )
+    _synced_mtime = mtime
+    return conn
+
+
+# Функции ниже пробрасывают sqlite3.Error: решать, как показать недоступность
+# курсов, и не кэшировать такие ошибки — дело вызывающего кода.
+
+
+def get_rate(a, b):
+    """Возвращает курс a→b или None, если пары нет."""
+    row = _sync().execute(
+        "SELECT rate FROM rates WHERE frm = ? AND to_ = ?", (a, b)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def get_rates_to(b):
+    """Возвращает курсы всех валют к b одним запросом: {from: rate}."""
+    return dict(_sync().execute("SELECT frm, rate FROM rates WHERE to_ = ?", (b,)))
+
+
+def has_currency(code):
+    """Проверяет, есть ли курсы из валюты code."""
+    row = _sync().execute(
+        "SELECT 1 FROM rates WHERE frm = ? LIMIT 1", (code,)
+    ).fetchone()
+    return row is not None
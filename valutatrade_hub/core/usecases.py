@@ -1,30 +1,123 @@
+import copy
+import functools
 import json
-import shlex
-import hashlib
-from datetime import datetime
-from valutatrade_hub.core.models import User, Portfolio, Wallet
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+from valutatrade_hub.core import rates_store
+from valutatrade_hub.core.models import (
+    HASH_SCHEME_V1,
+    HASH_SCHEME_V2,
+    Portfolio,
+    User,
+    Wallet,
+)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 DATA_DIR = "data"
 USERS_FILE = f"{DATA_DIR}/users.json"
 PORTFOLIOS_FILE = f"{DATA_DIR}/portfolios.json"
-RATES_FILE = f"{DATA_DIR}/rates.json"
+PORTFOLIOS_LOG = f"{DATA_DIR}/portfolios.log"
+
+# Писать JSON с отступами (для отладки); по умолчанию — компактно
+PRETTY_JSON = False
+
+# После стольких записей в журнал сделки сворачиваются в portfolios.json
+SNAPSHOT_EVERY = 100
 
 SESSION = {"current_user": None}
 
+# Допустимые опции команд
+_ALLOWED_CREDENTIALS = frozenset({"--username", "--password"})
+_ALLOWED_SHOW_PORTFOLIO = frozenset({"--base"})
+_ALLOWED_TRADE = frozenset({"--currency", "--amount"})
+_ALLOWED_GET_RATE = frozenset({"--from", "--to"})
+
+# path -> (st_mtime_ns, разобранные данные)
+_JSON_CACHE: dict[str, tuple[int, object]] = {}
+
+# (список пользователей, {username: user_dict}, максимальный user_id)
+_USERS_INDEX: tuple[list, dict[str, dict], int] | None = None
+
+_journal = None
+_journal_count = 0
+# последний выданный номер записи журнала
+_journal_seq = None
+
 
 def load_json(path):
-    """Загружает JSON-файл по указанному пути."""
+    """
+    Загружает JSON-файл по указанному пути.
+    Разобранные данные кэшируются и перечитываются только при изменении mtime файла.
+    """
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        mtime = os.stat(path).st_mtime_ns
     except FileNotFoundError:
         return []
 
+    cached = _JSON_CACHE.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    _JSON_CACHE[path] = (mtime, data)
+    return data
+
+
+def _dumps(data) -> bytes:
+    """Сериализует данные в UTF-8 JSON: через orjson, если он установлен."""
+    if PRETTY_JSON:
+        return json.dumps(data, indent=4, ensure_ascii=False).encode()
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False).encode()
+
+
+def _fsync_dir(path):
+    """Сбрасывает на диск каталог, чтобы переименование файла в нём пережило сбой."""
+    try:
+        fd = os.open(path or ".", os.O_RDONLY)
+    except OSError:
+        # например, Windows не даёт открыть каталог
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
 
 def save_json(path, data):
-    """Сохраняет данные в JSON-файл по указанному пути."""
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+    """
+    Сохраняет данные в JSON-файл по указанному пути и обновляет кэш.
+    Запись идёт во временный файл, который затем атомарно заменяет исходный.
+    """
+    payload = memoryview(_dumps(data))
+    tmp = path + ".tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        try:
+            while payload:
+                payload = payload[os.write(fd, payload):]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    _fsync_dir(os.path.dirname(path))
+    _JSON_CACHE[path] = (os.stat(path).st_mtime_ns, data)
 
 
 def parse_args(arg_list, allowed):
@@ -41,95 +134,240 @@ def parse_args(arg_list, allowed):
     return result
 
 
+def _get_users_indexed():
+    """
+    Возвращает (users, {username: user_dict}, max_id).
+    Индекс перестраивается только когда load_json вернул новый список.
+    """
+    global _USERS_INDEX
+    users = load_json(USERS_FILE)
+    if _USERS_INDEX is None or _USERS_INDEX[0] is not users:
+        idx = {u["username"]: u for u in users}
+        max_id = max((u["user_id"] for u in users), default=0)
+        _USERS_INDEX = (users, idx, max_id)
+    return _USERS_INDEX
+
+
+def _get_portfolios_state():
+    """
+    Возвращает содержимое portfolios.json в виде
+    {"journal_seq": N, "portfolios": {str(user_id): {"wallets": {...}}}},
+    где journal_seq — номер последней записи журнала, вошедшей в снимок.
+    Файлы в старых форматах (список или словарь портфелей без journal_seq)
+    конвертируются при первой загрузке.
+    """
+    data = load_json(PORTFOLIOS_FILE)
+    if isinstance(data, dict) and "portfolios" in data:
+        return data
+
+    if isinstance(data, list):
+        state = {
+            "journal_seq": 0,
+            "portfolios": {
+                str(p["user_id"]): {"wallets": p.get("wallets", {})}
+                for p in data
+            },
+        }
+    else:
+        # номер снимка раньше хранился рядом с портфелями под ключом "_journal_seq"
+        state = {
+            "journal_seq": data.get("_journal_seq", 0),
+            "portfolios": {k: v for k, v in data.items() if k != "_journal_seq"},
+        }
+    cached = _JSON_CACHE.get(PORTFOLIOS_FILE)
+    if cached:
+        _JSON_CACHE[PORTFOLIOS_FILE] = (cached[0], state)
+    return state
+
+
 def get_user_by_username(username):
     """Получает словарь данных пользователя по его username."""
-    users = load_json(USERS_FILE)
-    for u in users:
-        if u["username"] == username:
-            return u
-    return None
+    return _get_users_indexed()[1].get(username)
 
 
 def load_portfolio(user_id):
-    """Загружает портфель пользователя:"""
-    portfolios = load_json(PORTFOLIOS_FILE)
-    for p in portfolios:
-        if p["user_id"] == user_id:
-            wallets = {
-                code: Wallet(code, w["balance"])
-                for code, w in p.get("wallets", {}).items()
-            }
-            return {"user_id": user_id, "wallets": wallets}
-    return None
-
-
-def save_portfolios():
-    """Сохраняет текущее состояние портфеля"""
-    users_portfolios = load_json(PORTFOLIOS_FILE)
-    result = []
-    for p in users_portfolios:
-        if p["user_id"] == SESSION["current_user"].user_id:
-            portfolio = SESSION["current_user"].portfolio
-            data = {code: {"balance": w.balance} for code, w in portfolio.wallets.items()}
-            result.append({"user_id": p["user_id"], "wallets": data})
-        else:
-            result.append(p)
-    save_json(PORTFOLIOS_FILE, result)
+    """Загружает портфель пользователя: снимок из portfolios.json + журнал сделок."""
+    state = _get_portfolios_state()
+    p = state["portfolios"].get(str(user_id))
+    if p is None:
+        return None
+    balances = {code: w["balance"] for code, w in p.get("wallets", {}).items()}
+    for rec in _pending_journal(state["journal_seq"]):
+        if rec["uid"] == user_id:
+            for code, delta in rec["deltas"]:
+                balances[code] = balances.get(code, 0.0) + delta
+    wallets = {code: Wallet(code, bal) for code, bal in balances.items()}
+    return {"user_id": user_id, "wallets": wallets}
+
+
+def _read_journal():
+    """Построчно читает журнал сделок portfolios.log."""
+    try:
+        with open(PORTFOLIOS_LOG, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # недописанная строка после сбоя
+                    continue
+    except FileNotFoundError:
+        return
 
 
-def load_rates():
-    """Загружает таблицу курсов валют из rates.json."""
+def _open_journal():
+    """
+    Открывает журнал на дозапись. Если после сбоя файл обрывается
+    недописанной строкой, она отрезается, иначе следующая запись
+    склеилась бы с ней и тоже потерялась бы при чтении.
+    """
     try:
-        with open(RATES_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(PORTFOLIOS_LOG, "rb+") as f:
+            if f.seek(0, os.SEEK_END):
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.seek(0)
+                    f.truncate(f.read().rfind(b"\n") + 1)
     except FileNotFoundError:
-        return {}
+        pass
+    return open(PORTFOLIOS_LOG, "a", buffering=1, encoding="utf-8")
+
+
+def _pending_journal(done):
+    """
+    Записи журнала с номером больше done, т. е. ещё не свёрнутые в снимок.
+    Если процесс упал после записи снимка, но до очистки журнала,
+    уже учтённые записи пропускаются по номеру, а не применяются повторно.
+    """
+    for rec in _read_journal():
+        if rec["seq"] > done:
+            yield rec
+
+
+def _journal_write(user_id, deltas):
+    """
+    Дописывает сделку в журнал вместо перезаписи portfolios.json.
+    deltas — список пар [код валюты, изменение баланса] в порядке применения;
+    вся сделка пишется одной строкой, поэтому при сбое она либо сохраняется
+    целиком, либо теряется целиком.
+    Строка сбрасывается на диск сразу (построчная буферизация), но без fsync:
+    при сбое ОС можно потерять последние сделки — это плата за то, что
+    на каждую сделку пишется ~60 байт, а не весь файл портфелей.
+    """
+    global _journal, _journal_count, _journal_seq
+    if _journal is None:
+        _journal = _open_journal()
+    if _journal_seq is None:
+        _journal_seq = max(
+            [_get_portfolios_state()["journal_seq"]]
+            + [rec["seq"] for rec in _read_journal()]
+        )
+    _journal_seq += 1
+    rec = {"seq": _journal_seq, "uid": user_id, "deltas": deltas}
+    _journal.write(json.dumps(rec) + "\n")
+    _journal_count += 1
+    if _journal_count >= SNAPSHOT_EVERY:
+        snapshot()
+
+
+def snapshot():
+    """Накатывает журнал на portfolios.json и очищает журнал."""
+    global _journal, _journal_count
+    if _journal is not None:
+        _journal.close()
+        _journal = None
+    _journal_count = 0
+
+    state = _get_portfolios_state()
+    records = list(_pending_journal(state["journal_seq"]))
+    if records:
+        # сворачиваем в копию: при ошибке записи кэш остаётся согласованным с диском
+        portfolios = copy.deepcopy(state["portfolios"])
+        for rec in records:
+            wallets = portfolios.setdefault(str(rec["uid"]), {"wallets": {}})["wallets"]
+            for code, delta in rec["deltas"]:
+                wallet = wallets.setdefault(code, {"balance": 0.0})
+                wallet["balance"] += delta
+        save_json(
+            PORTFOLIOS_FILE,
+            {"journal_seq": records[-1]["seq"], "portfolios": portfolios},
+        )
+    if os.path.exists(PORTFOLIOS_LOG):
+        open(PORTFOLIOS_LOG, "w", encoding="utf-8").close()
+
+
+@functools.lru_cache(maxsize=256)
+def _get_rate_cached(a, b, mtime):
+    # mtime входит в ключ: после изменения rates.json старые записи не используются
+    return rates_store.get_rate(a, b)
 
 
 def get_rate(a, b):
     """Получает обменный курс"""
-    rates = load_rates()
-    if a in rates and b in rates[a]:
-        return rates[a][b]
-    return None
+    try:
+        mtime = os.stat(rates_store.RATES_FILE).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    try:
+        return _get_rate_cached(a, b, mtime)
+    except sqlite3.Error:
+        # ошибка базы не попадает в lru_cache: следующий вызов спросит заново
+        return None
+
+
+def _get_rates_to(base):
+    """Курсы всех валют к base одним запросом; None, если base неизвестна."""
+    try:
+        if not rates_store.has_currency(base):
+            return None
+        return rates_store.get_rates_to(base)
+    except sqlite3.Error:
+        return None
 
 def register(username: str, password: str):
     """Регистрация нового пользователя"""
-    users = load_json(USERS_FILE)
+    global _USERS_INDEX
+    users, idx, max_id = _get_users_indexed()
 
-    for u in users:
-        if u["username"] == username:
-            raise ValueError(f"Имя пользователя '{username}' уже занято")
+    if username in idx:
+        raise ValueError(f"Имя пользователя '{username}' уже занято")
 
     if len(password) < 4:
         raise ValueError("Пароль должен быть не короче 4 символов")
 
-    user_id = max([u["user_id"] for u in users], default=0) + 1
+    user_id = max_id + 1
 
     salt = User.generate_salt()
-    hashed = hashlib.sha256((password + salt).encode()).hexdigest()
+    hashed = User.hash_password(password, salt)
 
     new_user = {
         "user_id": user_id,
         "username": username,
         "hashed_password": hashed,
         "salt": salt,
-        "registration_date": datetime.utcnow().isoformat(),
+        "hash_scheme": HASH_SCHEME_V2,
+        "registration_date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
     }
 
-    users.append(new_user)
-    save_json(USERS_FILE, users)
+    # кэшированные список и индекс меняются только после успешной записи
+    new_users = users + [new_user]
+    save_json(USERS_FILE, new_users)
+    idx[username] = new_user
+    _USERS_INDEX = (new_users, idx, user_id)
 
-    portfolios = load_json(PORTFOLIOS_FILE)
-    portfolios.append({"user_id": user_id, "wallets": {}})
-    save_json(PORTFOLIOS_FILE, portfolios)
+    state = _get_portfolios_state()
+    save_json(PORTFOLIOS_FILE, {
+        "journal_seq": state["journal_seq"],
+        "portfolios": {**state["portfolios"], str(user_id): {"wallets": {}}},
+    })
 
     return f"Пользователь '{username}' зарегистрирован (id={user_id})."
 
 
 def login(args):
     """Авторизация пользователя."""
-    parts = parse_args(args, ["--username", "--password"])
+    parts = parse_args(args, _ALLOWED_CREDENTIALS)
     username = parts.get("--username")
     password = parts.get("--password")
 
@@ -147,6 +385,7 @@ def login(args):
         username=user_data["username"],
         hashed_password=user_data["hashed_password"],
         salt=user_data["salt"],
+        hash_scheme=user_data.get("hash_scheme", HASH_SCHEME_V1),
         registration_date=datetime.fromisoformat(user_data["registration_date"]),
     )
 
@@ -167,7 +406,7 @@ def show_portfolio(args):
         print("Сначала выполните login")
         return
 
-    parts = parse_args(args, ["--base"])
+    parts = parse_args(args, _ALLOWED_SHOW_PORTFOLIO)
     base = parts.get("--base", "USD").upper()
     user = SESSION["current_user"]
 
@@ -176,8 +415,8 @@ def show_portfolio(args):
         print("У вас пока нет кошельков")
         return
 
-    rates = load_rates()
-    if base not in rates:
+    base_rates = _get_rates_to(base)
+    if base_rates is None:
         print(f"Неизвестная базовая валюта '{base}'")
         return
 
@@ -189,7 +428,7 @@ def show_portfolio(args):
         if code == base:
             conv = bal
         else:
-            r = get_rate(code, base)
+            r = base_rates.get(code)
             conv = bal * r if r else 0
 
         total += conv
@@ -206,7 +445,7 @@ def buy(args):
         print("Сначала выполните login")
         return
 
-    params = parse_args(args, {"--currency", "--amount"})
+    params = parse_args(args, _ALLOWED_TRADE)
     currency = params.get("--currency")
     amount = params.get("--amount")
 
@@ -219,22 +458,19 @@ def buy(args):
         return
 
     currency = currency.upper()
-    portfolio = user.portfolio
-
-    if currency not in portfolio.wallets:
-        portfolio.add_currency(currency)
-
-    wallet = portfolio.wallets[currency]
-    before = wallet.balance
-    wallet.balance += amount
-
     rate = get_rate(currency, "USD")
     if rate is None:
         print(f"Не удалось получить курс для {currency}→USD")
         return
 
+    portfolio = user.portfolio
+
+    wallet = portfolio.get_or_create_wallet(currency)
+    before = wallet.balance
+    wallet._add(amount)
+
     cost = amount * rate
-    save_portfolios()
+    _journal_write(user.user_id, [[currency, amount]])
 
     print(f"Покупка выполнена: {amount:.4f} {currency} по курсу {rate:.2f} USD/{currency}")
     print("Изменения в портфеле:")
@@ -249,7 +485,7 @@ def sell(args):
         print("Сначала выполните login")
         return
 
-    params = parse_args(args, {"--currency", "--amount"})
+    params = parse_args(args, _ALLOWED_TRADE)
     currency = params.get("--currency")
     amount = params.get("--amount")
 
@@ -264,31 +500,27 @@ def sell(args):
     currency = currency.upper()
     portfolio = user.portfolio
 
-    if currency not in portfolio.wallets:
+    wallet = portfolio.get_wallet(currency)
+    if wallet is None:
         print(f"У вас нет кошелька '{currency}'. Добавьте валюту покупкой.")
         return
 
-    wallet = portfolio.wallets[currency]
-
     if wallet.balance < amount:
         print(f"Недостаточно средств: доступно {wallet.balance:.4f} {currency}, требуется {amount:.4f} {currency}")
         return
 
-    before = wallet.balance
-    wallet.balance -= amount
-
     rate = get_rate(currency, "USD")
     if rate is None:
         print(f"Не удалось получить курс для {currency}→USD")
         return
 
-    revenue = amount * rate
+    before = wallet.balance
+    wallet._sub(amount)
 
-    if "USD" not in portfolio.wallets:
-        portfolio.add_currency("USD")
+    revenue = amount * rate
 
-    portfolio.wallets["USD"].balance += revenue
-    save_portfolios()
+    portfolio.get_or_create_wallet("USD")._add(revenue)
+    _journal_write(user.user_id, [[currency, -amount], ["USD", revenue]])
 
     print(f"Продажа: {amount:.4f} {currency} по курсу {rate:.2f} USD/{currency}")
     print("Изменения в портфеле:")
@@ -296,9 +528,9 @@ def sell(args):
     print(f"Оценочная выручка: {revenue:,.2f} USD")
 
 
-def get_rate(args):
+def get_rate_cmd(args):
     """получает текущий курс одной валюты к другой."""
-    params = parse_args(args, {"--from", "--to"})
+    params = parse_args(args, _ALLOWED_GET_RATE)
     c_from = params.get("--from", "").upper()
     c_to = params.get("--to", "").upper()
 
@@ -311,8 +543,22 @@ def get_rate(args):
         print(f"Курс {c_from}→{c_to} недоступен. Повторите попытку позже.")
         return
 
-    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    ts = time.strftime("%Y-%m-%d %H:%M:%S")
 
     print(f"Курс {c_from}→{c_to}: {rate} (обновлено: {ts})")
     if rate != 0:
-        print(f"Обратный курс {c_to}→{c_from}: {1 / rate:.5f}")
\ No newline at end of file
+        print(f"Обратный курс {c_to}→{c_from}: {1 / rate:.5f}")
+
+
+def register_cmd(args):
+    """Обрабатывает команду register."""
+    params = parse_args(args, _ALLOWED_CREDENTIALS)
+    username = params.get("--username")
+    password = params.get("--password")
+    if username and password:
+        try:
+            print(register(username, password))
+        except ValueError as e:
+            print(e)
+    else:
+        print("Укажите --username и --password")